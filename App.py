@@ -1,34 +1,68 @@
+# gevent debe parchear sockets/ssl ANTES de importar requests, para que la llamada a Rasa
+# ceda el control al loop en vez de bloquear el worker.
+from gevent import monkey
+monkey.patch_all()
+
 from flask import Flask, request, jsonify, render_template
 import requests, os
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 app = Flask(__name__)
 
 RASA_URL = os.getenv("RASA_URL", "http://localhost:5005/webhooks/rest/webhook")
 
+# Un mensaje de chat cabe de sobra; el límite global también corta cuerpos chunked sin Content-Length
+MAX_CHAT_BYTES = 8 * 1024
+app.config["MAX_CONTENT_LENGTH"] = MAX_CHAT_BYTES
+
+# Sesión compartida: reutiliza conexiones (keep-alive) con Rasa en vez de abrir una por mensaje
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=Retry(total=1, backoff_factor=0.1))
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+SESSION.headers.update({"Content-Type": "application/json", "Connection": "keep-alive"})
+
 @app.route("/")
 def index():
     return render_template("index.html")
 
 @app.route("/chat", methods=["POST"])
 def chat():
-    data = request.get_json(silent=True) or {}
-    user_message = data.get("message", "").strip()
+    # Rechazar antes de leer el cuerpo: tipo de contenido incorrecto o tamaño excesivo
+    if request.mimetype != "application/json" or (request.content_length or 0) > MAX_CHAT_BYTES:
+        return jsonify({"error": "Solicitud inválida"}), 400
+    try:
+        data = orjson.loads(request.get_data(cache=False))
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return jsonify({"error": "Solicitud inválida"}), 400
+    user_message = data.get("message", "")
     sender_id = data.get("sender", "user")  # puedes pasar un session_id desde el front
+    if not isinstance(user_message, str) or not isinstance(sender_id, str):
+        return jsonify({"error": "Solicitud inválida"}), 400
+    user_message = user_message.strip()
 
     if not user_message:
         return jsonify({"error": "Mensaje vacío"}), 400
 
     try:
-        resp = requests.post(
+        resp = SESSION.post(
             RASA_URL,
-            json={"sender": sender_id, "message": user_message},
+            data=orjson.dumps({"sender": sender_id, "message": user_message}),
             timeout=8
         )
         resp.raise_for_status()
     except requests.RequestException as e:
         return jsonify({"error": f"Error connecting to Rasa: {e}"}), 502
 
-    rasa_msgs = resp.json() if isinstance(resp.json(), list) else []
+    try:
+        parsed = orjson.loads(resp.content)
+    except ValueError:  # orjson.JSONDecodeError; respuesta vacía o no-JSON
+        parsed = []
+    rasa_msgs = parsed if isinstance(parsed, list) else []
 
     bot_text = []
     buttons = []
@@ -45,13 +79,14 @@ def chat():
         if "custom" in msg:
             custom.append(msg["custom"])
 
-    return jsonify({
+    return app.response_class(orjson.dumps({
         "bot_response": " ".join(bot_text).strip(),
         "buttons": buttons,
         "images": images,
         "custom": custom
-    })
+    }), mimetype="application/json")
 
 if __name__ == "__main__":
-    # Para producción: debug=False
-    app.run(host="0.0.0.0", port=int(os.getenv("PORT", 8000)), debug=True)
+    # Producción: gunicorn -c gunicorn.conf.py App:app  (workers gevent, ver gunicorn.conf.py)
+    # Este arranque con el servidor de desarrollo de Werkzeug queda solo para pruebas locales.
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", 8000)), debug=False)
@@ -5,11 +5,14 @@
 
 import re
 import csv
+import hashlib
 import logging
+import threading
 import traceback
 import unicodedata
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Text, Optional
+from typing import Any, Dict, List, Text, Optional, Tuple
 
 from rasa_sdk import Action, Tracker
 from rasa_sdk.executor import CollectingDispatcher
@@ -21,6 +24,20 @@ try:
 except Exception:  # pragma: no cover
     from rasa_sdk import FormValidationAction
 
+# RE2 (tiempo lineal, sin backtracking) para validar texto libre del usuario, si está instalado
+try:
+    import re2
+except ImportError:  # pragma: no cover
+    re2 = None
+
+# pyarrow (opcional): lee data/radicados.parquet o parsea el CSV en C++; sin él se usa el módulo csv
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pa_pq
+except ImportError:  # pragma: no cover
+    pa = pa_csv = pa_pq = None
+
 logger = logging.getLogger(__name__)
 
 # ------------------------- Config de datos -------------------------
@@ -36,6 +53,8 @@ if _DB_PATH is None:
     # Fallback a la ruta “esperada” en el proyecto
     _DB_PATH = _THIS.parent / "data" / "radicados.csv"
 DB_PATH: Path = _DB_PATH
+# Copia columnar generada con scripts/csv_to_parquet.py (se usa solo si su hash de origen coincide con el CSV)
+PARQUET_PATH: Path = DB_PATH.with_suffix(".parquet")
 
 # Encabezados admitidos (variantes con/sin acento)
 H_ID        = ("Número de identificación", "Numero de identificacion", "numero_identificacion", "Cédula", "Cedula", "cedula")
@@ -61,21 +80,41 @@ H_CENTRO    = ("Centro carcelario", "Centro de reclusión", "Centro de reclusion
 H_ES_MENOR  = ("Es menor", "es_menor", "Menor", "menor", "Menor de edad", "menor_de_edad")
 H_EDAD      = ("Edad", "edad")
 
-_ROWS_CACHE: Optional[List[Dict[str, str]]] = None
+# Campo lógico → encabezados candidatos
+_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "id": H_ID, "tipo_doc": H_TIPO_DOC, "usr": H_USR, "defensor": H_DEFENSOR, "correo": H_CORREO,
+    "sup": H_SUP, "sup_mail": H_SUP_MAIL,
+    "rad": H_RAD, "dep": H_DEP, "mun": H_MUN, "juz": H_JUZ, "inicio": H_INICIO, "delito": H_DELITO,
+    "capt": H_CAPT, "tcap": H_TIPO_CAP, "med": H_MED, "centro": H_CENTRO,
+    "es_menor": H_ES_MENOR, "edad": H_EDAD,
+}
+
+# Campos del detalle de cada proceso, en el orden en que se desempaquetan
+PROCESS_COLS = ("rad", "dep", "mun", "juz", "inicio", "delito", "capt", "tcap", "med", "centro")
+
+Row = Tuple[str, ...]
+
+_LOAD_LOCK = threading.Lock()
+_ROWS_CACHE: Optional[List[Row]] = None
+_ID_INDEX: Dict[str, List[int]] = {}  # cédula (solo dígitos) → posiciones en _ROWS_CACHE
+_IS_MINOR: List[bool] = []            # ¿defendido menor? por fila, paralela a _ROWS_CACHE
+COLS: Dict[str, int] = {}  # campo lógico → índice de columna (se resuelve al leer el encabezado)
 
 # ------------------------- Utilidades -------------------------
+_DIGITS_RE = re.compile(r"\D")
+
 def _digits(s: Any) -> str:
     """Deja solo dígitos."""
-    return re.sub(r"\D", "", str(s or ""))
+    return _digits_cached(str(s or ""))
 
-def _get(row: Dict[str, Any], keys) -> str:
-    """Obtiene el primer valor no vacío para cualquiera de las llaves candidatas."""
-    for k in keys:
-        if k in row and row[k] is not None:
-            v = str(row[k]).strip()
-            if v != "":
-                return v
-    return ""
+@lru_cache(maxsize=8192)
+def _digits_cached(s: str) -> str:
+    return _DIGITS_RE.sub("", s)
+
+def _get(row: Row, key: str) -> str:
+    """Valor del campo lógico `key` ('' si la columna no existe en el CSV)."""
+    i = COLS.get(key)
+    return row[i] if i is not None else ""
 
 def _val(x: Any) -> str:
     """Valor o 'NA' si vacío."""
@@ -89,7 +128,14 @@ def _to_int(x: Any) -> Optional[int]:
         return None
 
 def _strip_accents_lower(s: Any) -> str:
-    t = unicodedata.normalize("NFKD", str(s or ""))
+    return _strip_accents_lower_cached(str(s or ""))
+
+@lru_cache(maxsize=8192)
+def _strip_accents_lower_cached(s: str) -> str:
+    if s.isascii():
+        # ASCII no cambia con NFKD ni tiene marcas combinantes: camino rápido
+        return s.lower()
+    t = unicodedata.normalize("NFKD", s)
     t = "".join(c for c in t if not unicodedata.combining(c))
     return t.lower()
 
@@ -97,33 +143,127 @@ def _norm_spaces(s: str) -> str:
     return re.sub(r"\s+", " ", s or "").strip()
 
 # ------------------------- Carga CSV -------------------------
-def _load_rows() -> List[Dict[str, str]]:
-    """Carga en memoria el CSV de radicados (con cache)."""
-    global _ROWS_CACHE
+def _norm_header(h: str) -> str:
+    return _norm_spaces(_strip_accents_lower(h))
+
+# Encabezado normalizado → (campo lógico, prioridad del alias en su tupla H_*); se arma una vez al importar
+HEADER_ALIAS: Dict[str, Tuple[str, int]] = {}
+for _field, _aliases in _FIELDS.items():
+    for _rank, _alias in enumerate(_aliases):
+        HEADER_ALIAS.setdefault(_norm_header(_alias), (_field, _rank))
+
+def _read_csv(path: Path) -> Tuple[List[str], List[Row]]:
+    """Encabezado y filas del CSV como tuplas de ancho fijo con valores ya sin espacios."""
+    with path.open("r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if pa_csv is not None and header:
+            try:
+                # Todas las columnas como texto (sin inferir tipos ni convertir "NA" a nulo)
+                table = pa_csv.read_csv(
+                    path,
+                    read_options=pa_csv.ReadOptions(column_names=header, skip_rows=1),
+                    parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+                    convert_options=pa_csv.ConvertOptions(
+                        column_types={h: pa.string() for h in header}, strings_can_be_null=False,
+                    ),
+                )
+                cols = [[v.strip() for v in c.to_pylist()] for c in table.columns]
+                return header, list(zip(*cols))
+            except pa.ArrowInvalid as e:
+                logger.warning("[lookup] pyarrow no pudo leer %s (%s); se usa csv", path, e)
+        width = len(header)
+        rows = [tuple(v.strip() for v in (r + [""] * (width - len(r)))[:width]) for r in reader if r]
+    return header, rows
+
+def _read_parquet(path: Path) -> Tuple[List[str], List[Row]]:
+    """Encabezado y filas del parquet (mismo formato que _read_csv)."""
+    table = pa_pq.read_table(path)
+    cols = [[("" if v is None else str(v)).strip() for v in c.to_pylist()] for c in table.columns]
+    return table.column_names, list(zip(*cols))
+
+def _use_parquet() -> bool:
+    """¿El parquet corresponde al CSV actual? (hash del CSV guardado por scripts/csv_to_parquet.py)"""
+    if pa_pq is None or not PARQUET_PATH.exists():
+        return False
+    if not DB_PATH.exists():
+        return True
+    try:
+        meta = pa_pq.read_schema(PARQUET_PATH).metadata or {}
+    except (OSError, pa.ArrowException) as e:
+        logger.warning("[lookup] Parquet ilegible %s (%s); se usa el CSV", PARQUET_PATH, e)
+        return False
+    current = hashlib.sha256(DB_PATH.read_bytes()).hexdigest().encode()
+    if meta.get(b"source_sha256") != current:
+        logger.warning("[lookup] %s no corresponde al CSV actual; se usa el CSV", PARQUET_PATH)
+        return False
+    return True
+
+def _coalesce(row: Row, multi: List[List[int]]) -> Row:
+    r = list(row)
+    for idx in multi:
+        r[idx[0]] = next((row[i] for i in idx if row[i]), "")
+    return tuple(r)
+
+def _load_rows() -> List[Row]:
+    """Carga en memoria el CSV de radicados (con cache, una sola vez aunque lleguen peticiones concurrentes)."""
+    global _ROWS_CACHE, _ID_INDEX, _IS_MINOR, COLS
     if _ROWS_CACHE is not None:
         return _ROWS_CACHE
-    if not DB_PATH.exists():
-        logger.error(f"[lookup] No existe el CSV en: {DB_PATH}")
-        _ROWS_CACHE = []
+    with _LOAD_LOCK:
+        if _ROWS_CACHE is not None:
+            return _ROWS_CACHE
+        use_parquet = _use_parquet()
+        if not use_parquet and not DB_PATH.exists():
+            logger.error("[lookup] No existe el CSV en: %s", DB_PATH)
+            _ROWS_CACHE = []
+            return _ROWS_CACHE
+        src = PARQUET_PATH if use_parquet else DB_PATH
+        header, rows = _read_parquet(src) if use_parquet else _read_csv(src)
+        # Columnas candidatas por campo, ordenadas por prioridad del alias (no por posición en el archivo)
+        cands: Dict[str, List[Tuple[int, int]]] = {}
+        for i, h in enumerate(header):
+            hit = HEADER_ALIAS.get(_norm_header(h))
+            if hit is not None:
+                field, rank = hit
+                cands.setdefault(field, []).append((rank, i))
+        order = {field: [i for _, i in sorted(c)] for field, c in cands.items()}
+        COLS = {field: idx[0] for field, idx in order.items()}
+        # Campo con varias columnas: se deja en la principal el primer valor no vacío
+        multi = [idx for idx in order.values() if len(idx) > 1]
+        if multi:
+            rows = [_coalesce(r, multi) for r in rows]
+        # Cédula normalizada una sola vez por fila + índice: la consulta pasa de O(N) a O(1)
+        _ID_INDEX = {}
+        for i, ced in enumerate(_DIGITS_RE.sub("", _get(r, "id")) for r in rows):
+            _ID_INDEX.setdefault(ced, []).append(i)
+        _IS_MINOR = [_row_is_minor_defendido(r) for r in rows]
+        # Se publica al final: quien vea _ROWS_CACHE ya encuentra índices completos
+        _ROWS_CACHE = rows
+        logger.info("[lookup] Cargadas %d filas desde %s", len(rows), src)
+        if rows:
+            logger.debug("[lookup] Encabezados: %s", header)
         return _ROWS_CACHE
-    with DB_PATH.open("r", encoding="utf-8-sig", newline="") as f:
-        _ROWS_CACHE = list(csv.DictReader(f))
-    logger.info(f"[lookup] Cargadas {len(_ROWS_CACHE)} filas desde {DB_PATH}")
-    if _ROWS_CACHE:
-        logger.debug(f"[lookup] Encabezados: {list(_ROWS_CACHE[0].keys())}")
-    return _ROWS_CACHE
+
+def _lookup_by_ced(ced: str) -> List[int]:
+    """Posiciones en _ROWS_CACHE de las filas cuya cédula (solo dígitos) coincide con `ced`."""
+    _load_rows()
+    return _ID_INDEX.get(ced, [])
 
 # ---- ¿Menor? SOLO si el tipo de documento es TI (o por edad/flag opcional) ----
-def _row_is_minor_defendido(row: Dict[str, Any]) -> bool:
-    tipo = _strip_accents_lower(_get(row, H_TIPO_DOC))
-    if tipo in {"ti", "tarjeta de identidad", "tarjeta_identidad", "tarjeta identidad"}:
+_TIPO_TI = frozenset({"ti", "tarjeta de identidad", "tarjeta_identidad", "tarjeta identidad"})
+_FLAG_SI = frozenset({"si", "sí", "true", "1", "x", "yes"})
+
+def _row_is_minor_defendido(row: Row) -> bool:
+    tipo = _strip_accents_lower(_get(row, "tipo_doc"))
+    if tipo in _TIPO_TI:
         return True
     # respaldos opcionales
-    edad = _to_int(_get(row, H_EDAD))
+    edad = _to_int(_get(row, "edad"))
     if edad is not None and 0 <= edad < 18:
         return True
-    es_menor_flag = _strip_accents_lower(_get(row, H_ES_MENOR))
-    if es_menor_flag in {"si", "sí", "true", "1", "x", "yes"}:
+    es_menor_flag = _strip_accents_lower(_get(row, "es_menor"))
+    if es_menor_flag in _FLAG_SI:
         return True
     return False
 
@@ -146,9 +286,9 @@ class ActionLookupCedula(Action):
                 return []
 
             # Filtrar por cédula
-            matches: List[Dict[str, str]] = [r for r in rows if _digits(_get(r, H_ID)) == ced]
+            matches_idx = _lookup_by_ced(ced)
 
-            if not matches:
+            if not matches_idx:
                 dispatcher.utter_message(
                     text="No encontré registros con esa cédula. ¿Quieres intentar de nuevo o hablar con un asesor?",
                     buttons=[
@@ -159,73 +299,69 @@ class ActionLookupCedula(Action):
                 return [SlotSet("numero_identificacion", None)]
 
             # Datos de contacto (primera coincidencia)
-            d_nombre = _val(_get(matches[0], H_DEFENSOR))
-            d_correo = _val(_get(matches[0], H_CORREO))
-            s_nombre = _val(_get(matches[0], H_SUP))
-            s_correo = _val(_get(matches[0], H_SUP_MAIL))
+            first = rows[matches_idx[0]]
+            d_nombre = _val(_get(first, "defensor"))
+            d_correo = _val(_get(first, "correo"))
+            s_nombre = _val(_get(first, "sup"))
+            s_correo = _val(_get(first, "sup_mail"))
 
             def_str = (d_nombre if d_nombre != "NA" else "No disponible") + (f" ({d_correo})" if d_correo != "NA" else "")
             sup_str = (s_nombre if s_nombre != "NA" else "No disponible") + (f" ({s_correo})" if s_correo != "NA" else "")
 
-            # ¿Todos los procesos corresponden a defendido menor?
-            all_minor = all(_row_is_minor_defendido(r) for r in matches)
+            # Una sola pasada: tarjeta por proceso (menor → mensaje mínimo; adulto → detalle completo)
+            # y, a la vez, ¿todos los procesos corresponden a defendido menor?
+            cards: List[str] = []
+            all_minor = True
+            proc_idx = [COLS.get(c) for c in PROCESS_COLS]
+            for i, k in enumerate(matches_idx, start=1):
+                if _IS_MINOR[k]:
+                    cards.append(
+                        f"### Proceso {i}\n"
+                        f"**Caso con persona menor de edad.**\n"
+                        f"**Defensor(a):** {def_str}\n"
+                        f"**Supervisor:** {sup_str}"
+                    )
+                    continue
+                all_minor = False
+
+                # Detalle normal (adulto)
+                # Valores ya vienen sin espacios desde la carga; vacío o columna ausente → 'NA'
+                r = rows[k]
+                rad, dep, mun, juz, inicio, delito, capt, tcap, med, centro = (
+                    (r[j] or "NA") if j is not None else "NA" for j in proc_idx
+                )
 
+                cards.append(
+                    f"### Proceso {i}\n"
+                    f"**Radicado:** `{rad}`\n"
+                    f"- **Departamento:** {dep}\n"
+                    f"- **Municipio:** {mun}\n"
+                    f"- **Juzgado:** {juz}\n"
+                    f"- **Inicio de proceso:** {inicio}\n"
+                    f"- **Delito:** {delito}\n"
+                    f"- **Capturado:** {capt}" + (f" ({tcap})" if tcap != 'NA' else "") + "\n"
+                    f"- **Medida:** {med}\n"
+                    f"- **Centro carcelario:** {centro} \n"
+                )
+
+            # Todo se envía en un solo mensaje (una sola serialización/entrega hacia Rasa)
             if all_minor:
                 # Mensaje mínimo SIN nombre de la persona
-                msg = (
+                parts = [
                     f"**Caso con persona menor de edad.**\n"
                     f"**Defensor(a):** {def_str}\n"
                     f"**Supervisor:** {sup_str}"
-                )
-                dispatcher.utter_message(text=msg)
-
+                ]
             else:
                 # Cabecera para adultos
                 header_md = f"**Defensor asignado:** {def_str}"
                 if s_nombre != 'NA' or s_correo != 'NA':
                     header_md += f"\n**Supervisor:** {sup_str}"
-                dispatcher.utter_message(text=header_md)
-
-                # Por cada proceso: si el defendido es menor → mensaje mínimo; si no, detalle completo
-                for i, r in enumerate(matches, start=1):
-                    if _row_is_minor_defendido(r):
-                        card = (
-                            f"### Proceso {i}\n"
-                            f"**Caso con persona menor de edad.**\n"
-                            f"**Defensor(a):** {def_str}\n"
-                            f"**Supervisor:** {sup_str}"
-                        )
-                        dispatcher.utter_message(text=card)
-                        continue
-
-                    # Detalle normal (adulto)
-                    rad    = _val(_get(r, H_RAD))
-                    dep    = _val(_get(r, H_DEP))
-                    mun    = _val(_get(r, H_MUN))
-                    juz    = _val(_get(r, H_JUZ))
-                    inicio = _val(_get(r, H_INICIO))
-                    delito = _val(_get(r, H_DELITO))
-                    capt   = _val(_get(r, H_CAPT))
-                    tcap   = _val(_get(r, H_TIPO_CAP))
-                    med    = _val(_get(r, H_MED))
-                    centro = _val(_get(r, H_CENTRO))
-
-                    card = (
-                        f"### Proceso {i}\n"
-                        f"**Radicado:** `{rad}`\n"
-                        f"- **Departamento:** {dep}\n"
-                        f"- **Municipio:** {mun}\n"
-                        f"- **Juzgado:** {juz}\n"
-                        f"- **Inicio de proceso:** {inicio}\n"
-                        f"- **Delito:** {delito}\n"
-                        f"- **Capturado:** {capt}" + (f" ({tcap})" if tcap != 'NA' else "") + "\n"
-                        f"- **Medida:** {med}\n"
-                        f"- **Centro carcelario:** {centro} \n"
-                    )
-                    dispatcher.utter_message(text=card)
+                parts = [header_md] + cards
 
+            parts.append("¿Quieres hacer otra consulta o volver al menú?")
             dispatcher.utter_message(
-                text="\n¿Quieres hacer otra consulta o volver al menú?",
+                text="\n\n".join(parts),
                 buttons=[
                     {"title": "🔁 Consultar otro número de documento", "payload": "/consultar_proceso"},
                     {"title": "🏠 Menú principal", "payload": "/saludar"},
@@ -265,8 +401,16 @@ _MEDIO_NOTIF_MAP = {
     "whatsapp": "telefono",  # si decides equipararlo
 }
 
-_EMAIL_RE = re.compile(r"^[A-Z0-9._%+\-]+@[A-Z0-9.\-]+\.[A-Z]{2,}$", re.IGNORECASE)
-_NAME_RE  = re.compile(r"^[A-Za-zÁÉÍÓÚÑáéíóúñüÜ'´` ]+$")
+# Clases de caracteres explícitas (sin IGNORECASE) para que ambos motores acepten exactamente lo mismo.
+# Fin de texto: `$` en RE2 (no acepta \Z y su `$` no admite "\n" final); `\Z` en `re`.
+_EMAIL_PATTERN = r"^[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}"
+_NAME_PATTERN  = r"^[A-Za-zÁÉÍÓÚÑáéíóúñüÜ'´` ]+"
+if re2 is not None:
+    _EMAIL_RE = re2.compile(_EMAIL_PATTERN + "$")
+    _NAME_RE  = re2.compile(_NAME_PATTERN + "$")
+else:
+    _EMAIL_RE = re.compile(_EMAIL_PATTERN + r"\Z")
+    _NAME_RE  = re.compile(_NAME_PATTERN + r"\Z")
 
 def _title_name(s: str) -> str:
     s = _norm_spaces(s)
@@ -283,14 +427,19 @@ def _tel_ok(digits: str) -> bool:
     # Ajusta a tu política (7–11 cubre fijos largos y celulares)
     return 7 <= len(digits) <= 11
 
+# Palabras clave por medio (se evalúan sobre texto ya sin acentos y en minúsculas)
+_MEDIO_TEL_RE  = re.compile(r"telefono|llamada|celular|movil|whatsapp")
+_MEDIO_MAIL_RE = re.compile(r"correo|e?-?mail|electronico")
+_MEDIO_FIS_RE  = re.compile(r"fisica|domicilio|direccion")
+
 def _map_medio(s: str) -> Optional[str]:
     """Mapea textos libres como 'por teléfono', 'correo electrónico', 'notificación física' a valores canónicos."""
     t = _strip_accents_lower(_norm_spaces(s))
-    if any(w in t for w in ("telefono", "teléfono", "llamada", "celular", "movil", "móvil", "whatsapp")):
+    if _MEDIO_TEL_RE.search(t):
         return "telefono"
-    if any(w in t for w in ("correo", "email", "e-mail", "mail", "electronico", "electrónico")):
+    if _MEDIO_MAIL_RE.search(t):
         return "correo"
-    if any(w in t for w in ("fisica", "física", "domicilio", "direccion", "dirección")):
+    if _MEDIO_FIS_RE.search(t):
         return "fisico"
     return None
 
@@ -0,0 +1,15 @@
+# gunicorn.conf.py — Servidor de la app Flask (App.py)
+# Workers gevent: cada /chat espera la respuesta HTTP de Rasa, así que un mismo proceso
+# atiende muchas conversaciones concurrentes con greenlets en vez de bloquearse.
+# Uso: gunicorn -c gunicorn.conf.py App:app
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '7860')}"
+worker_class = "gevent"
+# Pocos procesos: cada worker gevent ya multiplexa la E/S, y el contenedor también corre Rasa y el
+# servidor de acciones (os.cpu_count() además reporta los núcleos del host, no el límite del contenedor).
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_connections = 1000
+timeout = 30
+loglevel = "info"
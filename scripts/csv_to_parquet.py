@@ -0,0 +1,36 @@
+# csv_to_parquet.py — Convierte data/radicados.csv a parquet (todas las columnas como texto)
+# Uso: python scripts/csv_to_parquet.py [origen.csv] [destino.parquet]
+# actions.py prefiere el .parquet junto al CSV solo si el hash del CSV guardado en sus metadatos
+# coincide con el CSV actual (no depende de mtimes, que `cp -p`/`rsync -t`/unzip conservan).
+
+import csv
+import hashlib
+import sys
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def main(argv) -> int:
+    src = Path(argv[1]) if len(argv) > 1 else ROOT / "data" / "radicados.csv"
+    dst = Path(argv[2]) if len(argv) > 2 else src.with_suffix(".parquet")
+    if not src.exists():
+        print(f"No existe el CSV en: {src}", file=sys.stderr)
+        return 1
+    with src.open("r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        width = len(header)
+        rows = [(r + [""] * (width - len(r)))[:width] for r in reader if r]
+    arrays = [pa.array([r[i].strip() for r in rows], type=pa.string()) for i in range(width)]
+    table = pa.Table.from_arrays(arrays, names=header).replace_schema_metadata(
+        {b"source_sha256": hashlib.sha256(src.read_bytes()).hexdigest().encode()}
+    )
+    pq.write_table(table, dst)
+    print(f"{len(rows)} filas → {dst}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))